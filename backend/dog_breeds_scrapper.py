@@ -1,83 +1,203 @@
+import argparse
+import hashlib
 import json
 import asyncio
-import aiohttp
-import requests
+import logging
+import os
 import re
+from pathlib import Path
+import aiohttp
 import tqdm
-from bs4 import BeautifulSoup
-from lxml import html
+from lxml import etree, html
+
+
+logger = logging.getLogger(__name__)
+
+ROOT_URL = "https://wamiz.com"
+BREEDS_PATH = "/chiens/race-chien"
+
+# Status codes worth retrying, other HTTP errors fail the page right away
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# XPath expressions are compiled once and each one is evaluated once per page
+BREED_LINKS = etree.XPath(
+    "//*[contains(concat(' ', normalize-space(@class), ' '), ' listView-item-title--homepageBreed ')]/@href"
+)
+CELLS = etree.XPath("//table/tr/td")
+CELL_PARAGRAPHS = etree.XPath("//table/tr/td/p")
+CELL_SPANS = etree.XPath("//table/tr/td/div/span")
+CELL_LINK_DIVS = etree.XPath("//table/tr/td/a/div")
+CELL_LINK_SPANS = etree.XPath("//table/tr/td/a/span")
+CHARACTER_ICONS = etree.XPath("//table/tr/td/ul/li/a/img")
+LINK_SPANS = etree.XPath("a/span")
+
+
+class HtmlCache:
+    """
+    An on-disk cache of HTML pages along with the validators (ETag, Last-Modified)
+    needed to revalidate them with conditional requests.
+    """
 
+    def __init__(self, cache_dir: str):
+        """
+        Args:
+        - cache_dir (str): Directory where pages are cached, created if needed.
+        """
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
 
-async def fetch(session, url):
+    def __paths(self, url):
+        key = hashlib.sha1(url.encode("utf-8")).hexdigest()
+        return self.cache_dir / f"{key}.html", self.cache_dir / f"{key}.json"
+
+    def conditional_headers(self, url):
+        """
+        Build the conditional request headers for a cached page.
+
+        Returns:
+        - dict: 'If-None-Match' and/or 'If-Modified-Since' headers, empty if the page is not cached.
+        """
+        content_path, meta_path = self.__paths(url)
+        if not content_path.exists() or not meta_path.exists():
+            return {}
+
+        meta = json.loads(meta_path.read_text())
+        headers = {}
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+        return headers
+
+    def read(self, url):
+        """
+        Read a cached page.
+
+        Returns:
+        - str: The cached HTML content.
+        """
+        content_path, _ = self.__paths(url)
+        return content_path.read_text(encoding="utf-8")
+
+    def write(self, url, content, headers):
+        """
+        Cache a page and its validators.
+
+        Args:
+        - url (str): URL of the page.
+        - content (str): HTML content of the page.
+        - headers (Mapping): Response headers holding the validators.
+        """
+        content_path, meta_path = self.__paths(url)
+        content_path.write_text(content, encoding="utf-8")
+        meta_path.write_text(json.dumps({
+            "url": url,
+            "etag": headers.get("ETag"),
+            "last_modified": headers.get("Last-Modified")
+        }))
+
+
+async def fetch(session, url, cache, semaphore, retries=3, backoff=1.0):
     """
     Fetch the HTML content of a given URL asynchronously.
+    Cached pages are revalidated with a conditional request and read from the cache when unchanged.
+    Connection errors, timeouts and transient HTTP errors are retried with exponential backoff.
 
     Args:
     - session (aiohttp.ClientSession): The aiohttp session for making HTTP requests.
     - url (str): The URL to fetch content from.
+    - cache (HtmlCache): The on-disk HTML cache.
+    - semaphore (asyncio.Semaphore): Bounds the number of requests in flight.
+    - retries (int): Number of retries after the first attempt.
+    - backoff (float): Delay before the first retry, doubled at each retry.
 
     Returns:
     - str: The HTML content of the response.
+
+    Raises:
+    - aiohttp.ClientError, asyncio.TimeoutError: If the page could not be fetched.
     """
-    async with session.get(url) as response:
-        return await response.text()
+    headers = cache.conditional_headers(url)
+
+    for attempt in range(retries + 1):
+        try:
+            async with semaphore, session.get(url, headers=headers) as response:
+                if response.status == 304:
+                    return cache.read(url)
 
+                response.raise_for_status()
+                content = await response.text()
+                cache.write(url, content, response.headers)
+                return content
 
-def export_dog_breeds_links():
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            retryable = not isinstance(e, aiohttp.ClientResponseError) or e.status in RETRY_STATUSES
+            if not retryable or attempt == retries:
+                raise
+
+            delay = backoff * 2 ** attempt
+            logger.warning(f"Fetching {url} failed ({type(e).__name__}: {e}), retrying in {delay}s")
+            await asyncio.sleep(delay)
+
+
+def parse_dog_breeds_links(content):
     """
-    Scrape the main page for dog breeds to collect individual breed page links.
+    Parse the main page for dog breeds to collect individual breed page links.
+
+    Args:
+    - content (str): HTML content of the main page.
 
     Returns:
-    - tuple: Base URL for constructing full links and list of breed-specific paths.
+    - list: Breed-specific paths.
     """
-    response = requests.get("https://wamiz.com/chiens/race-chien")
-    soup = BeautifulSoup(response.text, 'html.parser')
-    races = soup.find_all(class_="listView-item-title--homepageBreed")
-    
-    breeds_links = [race.get('href') for race in races if race.get('href')]
-    return "https://wamiz.com", breeds_links
+    return [str(link) for link in BREED_LINKS(html.fromstring(content)) if link]
 
 
-async def parse_dog_breed_data(session, root, link):
+def parse_dog_breed_page(content, link):
     """
     Parse detailed data for a specific dog breed from its page.
 
     Args:
-    - session (aiohttp.ClientSession): The aiohttp session for HTTP requests.
-    - root (str): The root URL of the website.
+    - content (str): HTML content of the breed-specific page.
     - link (str): The relative link to the breed-specific page.
 
     Returns:
     - tuple: (Breed name, data dictionary with breed attributes such as lifetime, character, size, etc.)
+
+    Raises:
+    - ValueError, IndexError, AttributeError: If the page does not have the expected structure.
     """
-    response_content = await fetch(session, root + link)
-    tree = html.fromstring(response_content)
+    tree = html.fromstring(content)
+
+    cells = CELLS(tree)
+    paragraphs = CELL_PARAGRAPHS(tree)
+    spans = CELL_SPANS(tree)
 
     # Extracting various dog attributes based on the HTML structure
-    lifetime = tree.xpath("//table/tr/td/p")[1].text.strip()
-    character = [c.tail.strip() for c in tree.xpath("//table/tr/td/ul/li/a/img")]
-    size = tree.xpath("//table/tr/td/a/div")[0].text
+    lifetime = paragraphs[1].text.strip()
+    character = [c.tail.strip() for c in CHARACTER_ICONS(tree)]
+    size = CELL_LINK_DIVS(tree)[0].text
 
     female = {
-        "adult_size": tree.xpath("//table/tr/td/div/span")[1].text.strip(),
-        "adult_weight": tree.xpath("//table/tr/td/div/span")[5].text.strip()
+        "adult_size": spans[1].text.strip(),
+        "adult_weight": spans[5].text.strip()
     }
 
     male = {
-        "adult_size": tree.xpath("//table/tr/td/div/span")[3].text.strip(),
-        "adult_weight": tree.xpath("//table/tr/td/div/span")[7].text.strip()
+        "adult_size": spans[3].text.strip(),
+        "adult_weight": spans[7].text.strip()
     }
 
-    coat_colors_block = tree.xpath("//table/tr/td")[11]
-    coat_colors = [cc.text.strip() for cc in coat_colors_block.xpath("a/span")]
-
-    coat_type_block = tree.xpath("//table/tr/td")[13]
-    coat_type = [ct.text.strip() for ct in coat_type_block.xpath("a/span")]
-    eyes_color = tree.xpath("//table/tr/td/a/span")[0].text
-    price = tree.xpath("//table/tr/td/p")[-1].text.strip()
+    coat_colors = [cc.text.strip() for cc in LINK_SPANS(cells[11])]
+    coat_type = [ct.text.strip() for ct in LINK_SPANS(cells[13])]
+    eyes_color = CELL_LINK_SPANS(tree)[0].text
+    price = paragraphs[-1].text.strip()
 
     # Extract the breed name from the URL path
-    dog_breed = re.match(r'/chiens/([\w+-]+)-\d+', link).groups()[0]
+    match = re.match(r'/chiens/([\w+-]+)-\d+', link)
+    if match is None:
+        raise ValueError(f"Unexpected breed link: {link}")
+    dog_breed = match.groups()[0]
 
     return dog_breed, {
         "lifetime": lifetime,
@@ -92,35 +212,76 @@ async def parse_dog_breed_data(session, root, link):
     }
 
 
-async def export_dog_breeds_data(root, links):
+def write_json(data, output_path):
+    """
+    Write the breed data to a JSON file atomically, so that the file is always complete.
+    """
+    tmp_path = f"{output_path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, indent=4)
+    os.replace(tmp_path, output_path)
+
+
+async def export_dog_breeds_data(root, output_path, cache_dir, concurrency=8, retries=3, backoff=1.0, timeout=30):
     """
-    Asynchronously fetch and parse data for multiple dog breeds.
+    Asynchronously fetch and parse data for every dog breed, writing the JSON output
+    after each breed so that an interrupted run keeps the breeds already parsed.
+    A page that cannot be fetched or parsed is logged and skipped.
 
     Args:
     - root (str): The root URL of the website.
-    - links (list): List of breed-specific page paths.
+    - output_path (str): Path of the JSON output file.
+    - cache_dir (str): Directory of the on-disk HTML cache.
+    - concurrency (int): Maximum number of requests in flight.
+    - retries (int): Number of retries for each page.
+    - backoff (float): Delay before the first retry, doubled at each retry.
+    - timeout (float): Total timeout of each request, in seconds.
 
     Returns:
     - dict: Dictionary containing breed names and their associated data.
     """
     dog_breeds_data = {}
+    cache = HtmlCache(cache_dir)
+    semaphore = asyncio.Semaphore(concurrency)
+    connector = aiohttp.TCPConnector(limit=concurrency, limit_per_host=concurrency)
+
+    async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=timeout)) as session:
+        links = parse_dog_breeds_links(await fetch(session, root + BREEDS_PATH, cache, semaphore, retries, backoff))
+
+        async def export_dog_breed_data(link):
+            content = await fetch(session, root + link, cache, semaphore, retries, backoff)
+            return parse_dog_breed_page(content, link)
+
+        tasks = [export_dog_breed_data(link) for link in links]
 
-    async with aiohttp.ClientSession() as session:
-        tasks = [parse_dog_breed_data(session, root, link) for link in links]
-        
         # Progress bar for tracking asynchronous tasks
         for future in tqdm.tqdm(asyncio.as_completed(tasks), total=len(tasks)):
-            dog_breed, data = await future
+            try:
+                dog_breed, data = await future
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError, IndexError, AttributeError) as e:
+                logger.error(f"Skipping a breed page ({type(e).__name__}: {e})")
+                continue
+
             dog_breeds_data[dog_breed] = data
+            write_json(dog_breeds_data, output_path)
 
     return dog_breeds_data
 
 
 if __name__ == '__main__':
-    # Main script execution
-    root, links = export_dog_breeds_links()
-    data = asyncio.run(export_dog_breeds_data(root, links))
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 
-    # Save the collected breed data to a JSON file
-    with open('resources/dog_breeds_data.json', 'w') as f:
-        json.dump(data, f, indent=4)
+    parser = argparse.ArgumentParser(description="Scrape dog breeds data.")
+    parser.add_argument("--root", default=ROOT_URL, help="Root URL of the website")
+    parser.add_argument("--output", default="resources/dog_breeds_data.json", help="JSON output file")
+    parser.add_argument("--cache-dir", default="resources/html_cache", help="On-disk HTML cache directory")
+    parser.add_argument("--concurrency", type=int, default=8, help="Maximum number of requests in flight")
+    parser.add_argument("--retries", type=int, default=3, help="Number of retries for each page")
+    parser.add_argument("--timeout", type=float, default=30, help="Timeout of each request, in seconds")
+    args = parser.parse_args()
+
+    # Main script execution
+    data = asyncio.run(export_dog_breeds_data(
+        args.root, args.output, args.cache_dir, args.concurrency, args.retries, timeout=args.timeout
+    ))
+    logger.info(f"Exported data for {len(data)} dog breeds to {args.output}")
@@ -1,13 +1,21 @@
+import base64
+import json
 from typing import List
-from fastapi import FastAPI, HTTPException, File, UploadFile
+from fastapi import FastAPI, HTTPException, File, UploadFile, Request, Query, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from io import BytesIO
 from PIL import Image
+import numpy as np
 
-from backend import logger
+from backend import config, logger
 from backend.orm import orm
 from backend.utils.faiss_helper import FaissHelper
+from backend.utils.breed_tagger import BreedTagger
 from backend.utils.dataset_handler import DatasetHandler
+from backend.utils.index_registry import IndexRegistry
+from backend.utils.scheduler import ResourceScheduler, SchedulerOverloaded
 from backend.utils.vectorizer import Vectorizer
 
 
@@ -18,6 +26,7 @@ app = FastAPI()
 dataset_handler = DatasetHandler()
 vectorizer = Vectorizer()
 faiss_helper = FaissHelper(vectorizer.embedding_dim)
+scheduler = ResourceScheduler()
 
 # Set up CORS to allow requests from any origin
 app.add_middleware(
@@ -25,16 +34,92 @@ app.add_middleware(
     allow_origins=["*"],
     allow_credentials=True,
     allow_methods=["*"],
-    allow_headers=["*"]
+    allow_headers=["*"],
+    expose_headers=["X-Next-Offset", "Retry-After"]
 )
 
 # Download and prepare images if necessary
 logger.info("Downloading and preparing images if necessary.")
 dataset_handler.download_and_prepare_images(orm.is_sample_db_built())
 
+# Restore the live index version once the database is ready to validate it
+index_registry = IndexRegistry(faiss_helper, orm)
+
+# Load the breed prototypes and tag the dataset images with their known breed
+breed_tagger = BreedTagger(vectorizer, orm)
+breed_tagger.tag_sample_images()
+
+
+def warm_up() -> dict:
+    """
+    Runs representative batches on every encode and search worker so that the first
+    real query does not pay for lazy initialization, and reports the latencies.
+
+    Returns:
+        dict: Cold and warm latencies (ms) per work class and batch size.
+    """
+    warmup_config = config.get('warmup', {})
+    iterations = warmup_config.get('iterations', 3)
+
+    report = {
+        "query_encode": scheduler.run_on_workers(
+            "query_encode", vectorizer.warm_up_text, warmup_config.get('text_batch_sizes', [1]), iterations
+        ),
+        "image_encode": scheduler.run_on_workers(
+            "image_encode", vectorizer.warm_up_image, warmup_config.get('image_batch_sizes', [5]), iterations
+        )
+    }
+    scheduler.run_on_workers("vector_search", faiss_helper.search, np.zeros(vectorizer.embedding_dim), k=4)
+
+    for work_class, worker_reports in report.items():
+        for worker_report in worker_reports:
+            for batch_size, timings in worker_report.items():
+                logger.info(f"Warm-up {work_class} (batch size {batch_size}): "
+                            f"{timings['cold_ms']} ms before, {timings['warm_ms']} ms after")
+    return report
+
+
+# Warm up the model before serving so that the replica is only ready once queries are fast
+warmup_report = None
+if config.get('warmup', {}).get('enabled', True):
+    logger.info("Warming up the model.")
+    warmup_report = warm_up()
+
+
+@app.exception_handler(SchedulerOverloaded)
+async def scheduler_overloaded_handler(request: Request, exc: SchedulerOverloaded):
+    """
+    Rejects the request right away when the work class it needs is saturated,
+    telling the client when to retry instead of queueing it without bound.
+    """
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
+
+@app.on_event("shutdown")
+def shutdown_scheduler():
+    """
+    Stops the scheduler worker pools when the application shuts down.
+    """
+    scheduler.shutdown()
+
+
+@app.get("/api/ready")
+def ready():
+    """
+    Readiness endpoint, only reachable once the model has been loaded and warmed up.
+
+    Returns:
+        dict: The warm-up latencies report, or None if the warm-up is disabled.
+    """
+    return {"status": "ready", "warmup": warmup_report}
+
 
 @app.get("/api/findImagesForQuery/{query}", response_model=List[str])
-def find_images_for_query(query: str):
+async def find_images_for_query(query: str):
     """
     Endpoint to search and return images most similar to a given query.
 
@@ -46,15 +131,30 @@ def find_images_for_query(query: str):
     
     Raises:
         HTTPException: If no similar images are found, a 404 error is raised.
+        SchedulerOverloaded: If the encode or search pool is saturated (503).
     """
     # Use FAISS to find the most similar images for the query
-    embedding = vectorizer.compute_text_embedding(query)
-    distances, indices = faiss_helper.search(embedding, k=4)
+    embedding = await scheduler.run("query_encode", vectorizer.compute_text_embedding, query)
+    distances, indices = await scheduler.run("vector_search", faiss_helper.search, embedding, k=4)
     
     if indices.size == 0:
         logger.warning("No similar images found for this query.")
         raise HTTPException(status_code=404, detail="No similar images found.")
 
+    return await run_in_threadpool(get_images_for_indices, distances, indices)
+
+
+def get_images_for_indices(distances, indices) -> List[str]:
+    """
+    Retrieves from the database the images matching the FAISS search results.
+
+    Args:
+        distances (np.array): Distances of the closest neighbors.
+        indices (np.array): Embedding indexes of the closest neighbors.
+
+    Returns:
+        List[str]: List of base64-encoded images in the order of the search results.
+    """
     base64_images = []
     top_k_images = []
 
@@ -70,6 +170,91 @@ def find_images_for_query(query: str):
     return base64_images
 
 
+@app.get("/api/streamImagesForQuery/{query}")
+async def stream_images_for_query(
+        query: str,
+        k: int = Query(4, ge=1),
+        offset: int = Query(0, ge=0),
+        inline: bool = True):
+    """
+    Streaming variant of `find_images_for_query`: each hit is sent as one NDJSON line
+    as soon as its image is retrieved, so that the client can render the first results right away.
+
+    Args:
+        query (str): The text query to search for similar images.
+        k (int, optional): Number of hits to return. Defaults to 4.
+        offset (int, optional): Rank of the first hit to return, for pagination. Defaults to 0.
+        inline (bool, optional): If True, hits embed the base64-encoded image, otherwise its URL.
+
+    Returns:
+        StreamingResponse: NDJSON lines with the rank, distance, filename, breeds and image (or url) of each hit.
+            The 'X-Next-Offset' header holds the offset of the next page, it is omitted on the last page.
+
+    Raises:
+        HTTPException: If 'offset + k' exceeds 'max_search_k', a 422 error is raised.
+        SchedulerOverloaded: If the encode or search pool is saturated (503).
+    """
+    # The index is searched for 'offset + k' neighbors, which must stay bounded
+    max_search_k = config.get('max_search_k', 100)
+    if offset + k > max_search_k:
+        raise HTTPException(status_code=422, detail=f"offset + k must not exceed {max_search_k}.")
+
+    embedding = await scheduler.run("query_encode", vectorizer.compute_text_embedding, query)
+    distances, indices = await scheduler.run("vector_search", faiss_helper.search, embedding, k=offset + k)
+
+    async def stream_hits():
+        for rank in range(offset, len(indices)):
+            if indices[rank] < 0:
+                break
+
+            image = await run_in_threadpool(orm.get_image_by_index, indices[rank])
+            if not image:
+                continue
+
+            breeds = await run_in_threadpool(orm.get_breeds_by_index, indices[rank])
+            hit = {
+                "rank": rank,
+                "distance": float(distances[rank]),
+                "filename": image["filename"],
+                "breeds": breed_tagger.describe(breeds)
+            }
+            if inline:
+                hit["image"] = image["data"]
+            else:
+                hit["url"] = f"/api/images/{indices[rank]}"
+            yield json.dumps(hit) + "\n"
+
+    # Fewer than k hits means the results are exhausted
+    headers = {}
+    if (indices[offset:] >= 0).sum() == k and offset + k < max_search_k:
+        headers["X-Next-Offset"] = str(offset + k)
+
+    return StreamingResponse(stream_hits(), media_type="application/x-ndjson", headers=headers)
+
+
+@app.get("/api/images/{embedding_index}")
+def get_image(embedding_index: int):
+    """
+    Endpoint returning the raw image stored for an embedding index.
+
+    Args:
+        embedding_index (int): The embedding index of the image.
+
+    Returns:
+        Response: The decoded image.
+
+    Raises:
+        HTTPException: If no image is stored for this index, a 404 error is raised.
+    """
+    image = orm.get_image_by_index(embedding_index)
+    if not image:
+        raise HTTPException(status_code=404, detail="Image not found.")
+
+    # Images are stored as data URLs: 'data:<media type>;base64,<data>'
+    header, data = image["data"].split(",", 1)
+    return Response(content=base64.b64decode(data), media_type=header[len("data:"):].split(";")[0])
+
+
 @app.post("/api/uploadImages")
 async def upload_images(files: List[UploadFile] = File(...)):
     """
@@ -80,6 +265,9 @@ async def upload_images(files: List[UploadFile] = File(...)):
 
     Returns:
         None
+
+    Raises:
+        SchedulerOverloaded: If too many uploads are already queued (429).
     """
     images = []
 
@@ -93,7 +281,18 @@ async def upload_images(files: List[UploadFile] = File(...)):
         })
 
     # Generate and store image embeddings
-    vectorizer.generate_and_store_embedding_from_user_image(images, faiss_helper, orm)
+    await scheduler.run("image_encode", store_user_images, images)
+
+
+def store_user_images(images: List[dict]) -> None:
+    """
+    Stores uploaded images with their embeddings, then tags their breeds from these embeddings.
+
+    Args:
+        images (List[dict]): List of image data dictionaries containing the 'data' and 'filename' keys.
+    """
+    embedding_indexes, embeddings = vectorizer.generate_and_store_embedding_from_user_image(images, faiss_helper, orm)
+    breed_tagger.tag_images(embedding_indexes, embeddings)
 
 
 @app.delete("/api/removeUserImages")
@@ -107,3 +306,56 @@ def remove_user_images():
     # Purge user data from the ORM and FAISS index
     indexes = orm.purge_user_data()
     faiss_helper.purge_user_data(indexes)
+
+
+@app.get("/api/admin/indexes")
+def get_index_versions():
+    """
+    Admin endpoint listing the live, previous and available Faiss index versions.
+
+    Returns:
+        dict: The index registry status.
+    """
+    return index_registry.status()
+
+
+@app.post("/api/admin/indexes/{version}/swap")
+async def swap_index_version(version: str):
+    """
+    Admin endpoint loading a Faiss index version next to the live one and swapping it in atomically.
+    Searches keep being served by the live version while the new one is loaded in the 'index_load'
+    work class, whose thread cap and priority keep the load from competing with them.
+
+    Args:
+        version (str): Name of the version directory.
+
+    Returns:
+        dict: The index registry status after the swap.
+
+    Raises:
+        HTTPException: 404 if the version does not exist, 409 if it does not match the database.
+        SchedulerOverloaded: If another version is already being loaded (429).
+    """
+    try:
+        return await scheduler.run("index_load", index_registry.swap, version)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+@app.post("/api/admin/indexes/rollback")
+def rollback_index_version():
+    """
+    Admin endpoint swapping the previous Faiss index version back in.
+
+    Returns:
+        dict: The index registry status after the rollback.
+
+    Raises:
+        HTTPException: 409 if there is no previous version or it does not match the database.
+    """
+    try:
+        return index_registry.rollback()
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
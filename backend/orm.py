@@ -1,8 +1,8 @@
 from typing import List
 
-from sqlalchemy import create_engine, Column, Integer, String
-from sqlalchemy.orm import declarative_base, sessionmaker
-from sqlalchemy import exists
+from sqlalchemy import create_engine, Column, Integer, String, Float
+from sqlalchemy.orm import declarative_base, scoped_session, sessionmaker
+from sqlalchemy import exists, func
 
 from backend import config, logger
 from backend.utils.misc import singleton
@@ -26,6 +26,18 @@ class Image(Base):
     origin = Column(String, nullable=False)  # From user or from database
 
 
+class ImageBreed(Base):
+    """
+    Define the ImageBreed table in the database: the top breeds of each image.
+    """
+    __tablename__ = 'image_breeds'
+
+    id = Column(Integer, primary_key=True)
+    embedding_index = Column(Integer, nullable=False, index=True)
+    breed = Column(String, nullable=False, index=True)
+    score = Column(Float, nullable=False)
+
+
 @singleton
 class ORM:
     """
@@ -37,7 +49,8 @@ class ORM:
         Initialize the database connection and create a session.
 
         Sets up the SQLite engine, creates the tables if not already created,
-        and establishes a session for database operations.
+        and establishes a thread-local session for database operations, since the API
+        calls the ORM from several worker threads.
         """
         # Initialize SQLite database engine
         engine = create_engine(config['database_uri'])
@@ -46,9 +59,9 @@ class ORM:
         Base.metadata.create_all(engine)
         logger.info("Database and tables initialized.")
 
-        # Set up a session maker bound to the engine
+        # Set up a session maker bound to the engine, each thread gets its own session
         session = sessionmaker(bind=engine)
-        self.session = session()
+        self.session = scoped_session(session)
         logger.info("Session established for database operations.")
 
     def add_image(
@@ -89,11 +102,25 @@ class ORM:
             self,
             images_data: List,
     ) -> None:
+        """
+        Add several images to the database in a single transaction.
+
+        Args:
+            images_data (List): Tuples of (filename, base64_image, embedding_index, origin).
+
+        Raises:
+            Exception: If the commit fails, after rolling back the transaction so that no image is added.
+        """
         images = [Image(filename=filename, data=base64_image, embedding_index=embedding_index, origin=origin)
                   for filename, base64_image, embedding_index, origin in images_data]
 
-        self.session.add_all(images)
-        self.session.commit()
+        try:
+            self.session.add_all(images)
+            self.session.commit()
+        except Exception as e:
+            logger.error(f"Error adding images to database: {e}")
+            self.session.rollback()
+            raise
         logger.info(f"Inserted {len(images)} images into the database.")
 
     def get_image_by_index(self, embedding_index: int) -> dict:
@@ -117,6 +144,42 @@ class ORM:
             logger.warning(f"No image found for embedding index: {embedding_index}")
             return {}
 
+    def add_image_breeds(self, image_breeds: List) -> None:
+        """
+        Add the breeds of several images to the database.
+
+        Args:
+            image_breeds (List): Tuples of (embedding_index, breed, score).
+        """
+        self.session.add_all([
+            ImageBreed(embedding_index=int(embedding_index), breed=breed, score=float(score))
+            for embedding_index, breed, score in image_breeds
+        ])
+        self.session.commit()
+        logger.info(f"Inserted {len(image_breeds)} image breeds into the database.")
+
+    def get_breeds_by_index(self, embedding_index: int) -> List:
+        """
+        Retrieve the breeds of an image by its embedding index.
+
+        Args:
+            embedding_index (int): The embedding index of the image.
+
+        Returns:
+            List: Tuples of (breed, score), best score first.
+        """
+        return [
+            (image_breed.breed, image_breed.score)
+            for image_breed in self.session.query(ImageBreed)
+            .filter_by(embedding_index=int(embedding_index))
+            .order_by(ImageBreed.score.desc())
+        ]
+
+    def is_sample_db_tagged(self):
+        return self.session.query(exists().where(
+            ImageBreed.embedding_index == Image.embedding_index, Image.origin == 'database'
+        )).scalar()
+
     def purge_user_data(self):
         """
         Purge all images uploaded by users from the database and FAISS index.
@@ -130,13 +193,25 @@ class ORM:
         # Get the embedding indexes of the user images
         embedding_indexes = [image.embedding_index for image in user_images]
 
-        # Delete user images from the database
+        # Delete user images and their breeds from the database
+        self.session.query(ImageBreed).filter(ImageBreed.embedding_index.in_(embedding_indexes)).delete()
         self.session.query(Image).filter(Image.origin == 'user').delete()
         self.session.commit()
 
         logger.info(f"Purged {len(user_images)} user images from the database.")
         return embedding_indexes
 
+    def get_embedding_index_range(self) -> (int, int, int):
+        """
+        Retrieves the range of embedding indexes referenced by the database.
+
+        Returns:
+            tuple: The minimum and maximum embedding indexes (None if there is no image) and the number of images.
+        """
+        return self.session.query(
+            func.min(Image.embedding_index), func.max(Image.embedding_index), func.count(Image.id)
+        ).one()
+
     def is_sample_db_built(self):
         return self.session.query(exists().where(Image.origin == 'database')).scalar()
 
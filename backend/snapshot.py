@@ -0,0 +1,244 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+from datetime import datetime, timezone
+from pathlib import Path
+import faiss
+import numpy as np
+from sqlalchemy.engine import make_url
+from backend import config, logger
+
+SNAPSHOT_FORMAT_VERSION = 1
+MANIFEST_NAME = "manifest.json"
+
+
+def _database_path() -> Path:
+    """
+    Returns the path of the SQLite database file from the database URI.
+    """
+    return Path(make_url(config['database_uri']).database)
+
+
+def _live_index_paths() -> (Path, Path, Path):
+    """
+    Returns the paths of the flat index, the compressed index and the full-precision vectors currently
+    served: those of the live registry version if any, otherwise the writable flat index (or the read-only one).
+    """
+    live_file = Path(config['faiss_versions_path']) / "LIVE"
+    if live_file.exists():
+        version_path = Path(config['faiss_versions_path']) / live_file.read_text().strip()
+        return version_path / "index.faiss", version_path / "compressed_index.faiss", version_path / "embeddings.f32"
+
+    compressed_index_path = Path(config['compressed_faiss_index_path'])
+    embeddings_path = Path(config['embeddings_path'])
+    if Path(config['faiss_index_path']).exists():
+        return Path(config['faiss_index_path']), compressed_index_path, embeddings_path
+    return Path(config['readonly_faiss_index_path']), compressed_index_path, embeddings_path
+
+
+def _read_vectors(embeddings_path: Path, embedding_dim: int) -> np.array:
+    """
+    Reads the whole vectors of a full-precision vectors file, ignoring a partial trailing one.
+    """
+    n_vectors = embeddings_path.stat().st_size // (embedding_dim * 4)
+    vectors = np.fromfile(embeddings_path, dtype=np.float32, count=n_vectors * embedding_dim)
+    return vectors.reshape(n_vectors, embedding_dim)
+
+
+def _sha256(path: Path) -> str:
+    """
+    Computes the SHA-256 checksum of a file, reading it in chunks.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _count_database_embeddings(database_path: Path) -> int:
+    """
+    Returns the number of embeddings referenced by a database, i.e. 'max(embedding_index) + 1'.
+    """
+    connection = sqlite3.connect(f"file:{database_path}?mode=ro", uri=True)
+    try:
+        max_index = connection.execute("SELECT MAX(embedding_index) FROM images").fetchone()[0]
+    finally:
+        connection.close()
+    return 0 if max_index is None else max_index + 1
+
+
+def _copy_atomically(source: Path, destination: Path) -> None:
+    """
+    Copies a file next to its destination then renames it, so that the destination is never partial.
+    """
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = destination.with_name(destination.name + ".tmp")
+    shutil.copyfile(source, tmp_path)
+    os.replace(tmp_path, destination)
+
+
+def export_snapshot(snapshot_dir: str) -> dict:
+    """
+    Exports the database, the live Faiss index and its full-precision vectors into a snapshot
+    directory, along with a manifest holding the model name, the dimension and the checksums.
+    In compressed mode, the vectors are taken from the live vectors file, which holds the uploads.
+
+    Args:
+        snapshot_dir (str): Directory of the snapshot, created if needed.
+
+    Raises:
+        ValueError: If the index does not match the database.
+
+    Returns:
+        dict: The manifest of the snapshot.
+    """
+    snapshot_path = Path(snapshot_dir)
+    snapshot_path.mkdir(parents=True, exist_ok=True)
+
+    # Use the SQLite backup API to get a consistent copy even if the database is in use
+    source = sqlite3.connect(_database_path())
+    destination = sqlite3.connect(snapshot_path / "sqlite3.db")
+    try:
+        source.backup(destination)
+    finally:
+        source.close()
+        destination.close()
+
+    index_path, compressed_index_path, embeddings_path = _live_index_paths()
+    compressed = config.get('faiss_index_mode', 'flat') != 'flat'
+
+    # In compressed mode, uploads only reach the full-precision vectors, the flat index is rebuilt from them
+    if compressed:
+        compressed_index = faiss.read_index(str(compressed_index_path))
+        embeddings = _read_vectors(embeddings_path, compressed_index.d)
+        index = faiss.IndexFlatL2(compressed_index.d)
+        index.add(embeddings)
+    else:
+        index = faiss.read_index(str(index_path))
+        embeddings = index.reconstruct_n(0, index.ntotal).astype(np.float32)
+
+    n_database_embeddings = _count_database_embeddings(snapshot_path / "sqlite3.db")
+    if index.ntotal != n_database_embeddings:
+        raise ValueError(f"The index holds {index.ntotal} vectors, the database references {n_database_embeddings}")
+
+    faiss.write_index(index, str(snapshot_path / "index.faiss"))
+    embeddings.tofile(snapshot_path / "embeddings.f32")
+    files = ["sqlite3.db", "index.faiss", "embeddings.f32"]
+
+    # The saved compressed index holds a prefix of the vectors and is caught up on first start,
+    # it is only left out if it holds more vectors, and is then rebuilt
+    if compressed and compressed_index.ntotal <= index.ntotal:
+        shutil.copyfile(compressed_index_path, snapshot_path / "compressed_index.faiss")
+        files.append("compressed_index.faiss")
+    manifest = {
+        "format_version": SNAPSHOT_FORMAT_VERSION,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "clip_model": config['clip_model'],
+        "embedding_dim": index.d,
+        "n_vectors": index.ntotal,
+        "faiss_index_mode": config.get('faiss_index_mode', 'flat'),
+        "files": {
+            name: {"sha256": _sha256(snapshot_path / name), "size": (snapshot_path / name).stat().st_size}
+            for name in files
+        }
+    }
+
+    with open(snapshot_path / MANIFEST_NAME, 'w') as f:
+        json.dump(manifest, f, indent=4)
+
+    logger.info(f"Snapshot exported to {snapshot_path} with {index.ntotal} vectors")
+    return manifest
+
+
+def verify_snapshot(snapshot_dir: str) -> dict:
+    """
+    Checks a snapshot against its manifest and the current configuration.
+
+    Args:
+        snapshot_dir (str): Directory of the snapshot.
+
+    Raises:
+        ValueError: If the snapshot is incomplete, corrupted or built for another model.
+
+    Returns:
+        dict: The manifest of the snapshot.
+    """
+    snapshot_path = Path(snapshot_dir)
+    with open(snapshot_path / MANIFEST_NAME) as f:
+        manifest = json.load(f)
+
+    if manifest["format_version"] != SNAPSHOT_FORMAT_VERSION:
+        raise ValueError(f"Unsupported snapshot format version: {manifest['format_version']}")
+    if manifest["clip_model"] != config['clip_model']:
+        raise ValueError(f"Snapshot built with model {manifest['clip_model']}, expected {config['clip_model']}")
+
+    for name, file in manifest["files"].items():
+        path = snapshot_path / name
+        if not path.exists() or path.stat().st_size != file["size"]:
+            raise ValueError(f"Snapshot file {name} is missing or truncated")
+        if _sha256(path) != file["sha256"]:
+            raise ValueError(f"Snapshot file {name} is corrupted")
+
+    embeddings_size = manifest["n_vectors"] * manifest["embedding_dim"] * 4
+    if manifest["files"]["embeddings.f32"]["size"] != embeddings_size:
+        raise ValueError("Snapshot embeddings do not match the manifest dimension")
+
+    return manifest
+
+
+def import_snapshot(snapshot_dir: str) -> dict:
+    """
+    Verifies a snapshot then installs its files at the paths of the configuration.
+    Nothing is re-processed: the database and the index are used as they are on next start,
+    and in compressed mode the full-precision vectors are memory-mapped from 'embeddings_path'.
+    The API must be stopped while importing.
+
+    Args:
+        snapshot_dir (str): Directory of the snapshot.
+
+    Raises:
+        ValueError: If the snapshot does not pass verification.
+
+    Returns:
+        dict: The manifest of the snapshot.
+    """
+    snapshot_path = Path(snapshot_dir)
+    manifest = verify_snapshot(snapshot_dir)
+
+    # A compressed index built for another mode would not be the one configured
+    files = list(manifest["files"])
+    if manifest["faiss_index_mode"] != config.get('faiss_index_mode', 'flat'):
+        files = [name for name in files if name != "compressed_index.faiss"]
+
+    destinations = {
+        "sqlite3.db": _database_path(),
+        "index.faiss": Path(config['faiss_index_path']),
+        "embeddings.f32": Path(config['embeddings_path']),
+        "compressed_index.faiss": Path(config['compressed_faiss_index_path'])
+    }
+    for name in files:
+        _copy_atomically(snapshot_path / name, destinations[name])
+
+    # A stale compressed index left in place would not match the imported vectors
+    if "compressed_index.faiss" not in files:
+        destinations["compressed_index.faiss"].unlink(missing_ok=True)
+
+    # The imported index replaces any registry version previously made live
+    (Path(config['faiss_versions_path']) / "LIVE").unlink(missing_ok=True)
+
+    logger.info(f"Snapshot imported from {snapshot_path} with {manifest['n_vectors']} vectors")
+    return manifest
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Export or import a prebuilt DogSearch snapshot.")
+    parser.add_argument("command", choices=["export", "import", "verify"])
+    parser.add_argument("snapshot_dir", help="Directory of the snapshot")
+    args = parser.parse_args()
+
+    commands = {"export": export_snapshot, "import": import_snapshot, "verify": verify_snapshot}
+    print(json.dumps(commands[args.command](args.snapshot_dir), indent=4))
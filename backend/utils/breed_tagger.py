@@ -0,0 +1,154 @@
+import json
+from pathlib import Path
+from typing import List
+import numpy as np
+from backend import config, logger
+from backend.orm import ORM
+from backend.utils.misc import singleton
+from backend.utils.vectorizer import Vectorizer
+
+
+@singleton
+class BreedTagger:
+    """
+    A zero-shot breed classifier working on image embeddings already computed.
+
+    The CLIP text embeddings of a prompt for each of the dataset breeds are cached on disk
+    as a single prototype matrix, so that tagging a batch of images is one matrix product.
+    """
+
+    def __init__(self, vectorizer: Vectorizer, orm: ORM):
+        """
+        Loads the breed labels from the dataset paths, the prototype matrix (computed and cached
+        if missing or stale) and the scraped breed metadata.
+
+        Args:
+            vectorizer (Vectorizer): Vectorizer used to compute the prototypes if they are not cached.
+            orm (ORM): ORM instance for storing image breeds.
+        """
+        self.orm = orm
+        self.top_k = config.get('breed_top_k', 3)
+
+        # Dataset paths look like 'Images/n02085620-Chihuahua/n02085620_10074.jpg'
+        with open(config['image_paths']) as f:
+            self.image_labels = [to_breed_name(line.split('/')[1].split('-', 1)[1]) for line in f if line.strip()]
+        self.breeds = sorted(set(self.image_labels))
+
+        self.prototypes = self.__load_prototypes(vectorizer)
+        self.metadata = self.__load_metadata()
+
+    def __load_prototypes(self, vectorizer: Vectorizer) -> np.array:
+        """
+        Loads the prototype matrix from the cache, or computes and caches it with a single text batch.
+
+        Returns:
+            np.array: Normalized text embeddings of the breeds, one row per breed.
+        """
+        prototypes_path = Path(config['breed_prototypes_path'])
+        prompt = config.get('breed_prompt', "a photo of a {}, a type of dog.")
+        if prototypes_path.exists():
+            cache = np.load(prototypes_path)
+            # Caches written before the prompt was stored are stale
+            if (str(cache["model"]) == config['clip_model'] and cache["breeds"].tolist() == self.breeds
+                    and "prompt" in cache.files and str(cache["prompt"]) == prompt):
+                logger.info("Breed prototypes loaded from %s", prototypes_path)
+                return cache["prototypes"]
+
+        prompts = [prompt.format(breed) for breed in self.breeds]
+        prototypes = vectorizer.compute_text_embedding(prompts).cpu().numpy().astype(np.float32)
+
+        with open(prototypes_path, 'wb') as f:
+            np.savez(
+                f, prototypes=prototypes, breeds=np.array(self.breeds),
+                model=np.array(config['clip_model']), prompt=np.array(prompt)
+            )
+        logger.info("Breed prototypes computed for %d breeds and cached in %s", len(self.breeds), prototypes_path)
+        return prototypes
+
+    def __load_metadata(self) -> dict:
+        """
+        Builds the in-memory lookup table from breed name to scraped metadata.
+        Scraped breeds are matched on their normalized name, breeds without a match have no metadata.
+
+        Returns:
+            dict: Scraped metadata of each breed.
+        """
+        metadata_path = Path(config['dog_breeds_data_path'])
+        if not metadata_path.exists():
+            logger.warning("No scraped breed data found in %s", metadata_path)
+            return {}
+
+        with open(metadata_path) as f:
+            scraped = {to_breed_name(name).lower(): data for name, data in json.load(f).items()}
+
+        return {breed: scraped[breed.lower()] for breed in self.breeds if breed.lower() in scraped}
+
+    def classify(self, embeddings: np.array) -> List[List]:
+        """
+        Classifies images from their normalized embeddings with one product against the prototypes.
+
+        Args:
+            embeddings (np.array): Image embeddings, one row per image.
+
+        Returns:
+            List[List]: For each image, the top (breed, score) tuples, best score first.
+        """
+        scores = np.atleast_2d(np.asarray(embeddings, dtype=np.float32)) @ self.prototypes.T
+        top_k = np.argsort(-scores, axis=1)[:, :self.top_k]
+
+        return [
+            [(self.breeds[breed], float(image_scores[breed])) for breed in image_top_k]
+            for image_scores, image_top_k in zip(scores, top_k)
+        ]
+
+    def tag_images(self, embedding_indexes: List[int], embeddings: np.array) -> None:
+        """
+        Classifies images and stores their top breeds in the database.
+
+        Args:
+            embedding_indexes (List[int]): The embedding indexes of the images.
+            embeddings (np.array): Image embeddings, in the same order.
+        """
+        self.orm.add_image_breeds([
+            (embedding_index, breed, score)
+            for embedding_index, image_breeds in zip(embedding_indexes, self.classify(embeddings))
+            for breed, score in image_breeds
+        ])
+
+    def tag_sample_images(self) -> None:
+        """
+        Stores the breed of the dataset images, known from their path, if not done yet.
+        """
+        if self.orm.is_sample_db_tagged():
+            return
+
+        # Sample images are saved in the order of the dataset paths
+        self.orm.add_image_breeds([(index, label, 1.0) for index, label in enumerate(self.image_labels)])
+
+    def describe(self, image_breeds: List) -> List[dict]:
+        """
+        Attaches the scraped metadata to the breeds of an image.
+
+        Args:
+            image_breeds (List): Tuples of (breed, score).
+
+        Returns:
+            List[dict]: The breed, its score and its metadata (None if it was not scraped).
+        """
+        return [
+            {"breed": breed, "score": score, "metadata": self.metadata.get(breed)}
+            for breed, score in image_breeds
+        ]
+
+
+def to_breed_name(label: str) -> str:
+    """
+    Turns a dataset label or a scraped slug into a readable breed name.
+
+    Args:
+        label (str): The label, e.g. 'Siberian_husky' or 'golden-retriever'.
+
+    Returns:
+        str: The breed name, e.g. 'Siberian husky' or 'golden retriever'.
+    """
+    return label.replace('_', ' ').replace('-', ' ')
@@ -78,15 +78,17 @@ class DatasetHandler:
     def download_and_prepare_images(self, is_sample_db_built):
         """
         Manages the dataset download, extraction, and preparation.
-        - Checks if the images are already extracted and skips download if true.
+        - Checks if the images are already saved in the database and skips download if true.
         - Downloads the dataset archive if not already present.
         - Extracts the archive and saves each image to the database.
         - Deletes the archive file after successful extraction.
         """
         dataset_url = config["dataset_image_url"]
 
-        if self.dataset_path.exists() and any(self.dataset_path.iterdir()) and is_sample_db_built:
-            logger.info(f"Images already extracted in {self.dataset_path} and saved in database.")
+        # The database holds the images, the extracted files are only needed to build it
+        # (e.g. it may have been imported from a snapshot)
+        if is_sample_db_built:
+            logger.info("Images already saved in database.")
             return
 
         if not self.dataset_archive_path.exists() and not self.dataset_path.exists():
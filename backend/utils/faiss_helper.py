@@ -1,3 +1,5 @@
+import os
+import threading
 from pathlib import Path
 import faiss
 import numpy as np
@@ -5,12 +7,49 @@ from backend import config, logger
 from backend.utils.misc import singleton
 
 
+class IndexVersion:
+    """
+    A loaded Faiss index along with the files it is persisted to.
+    """
+
+    def __init__(self, name: str, index: faiss.Index, index_path: str, embeddings_path: str = None):
+        """
+        Args:
+            name (str): Name of the version.
+            index (faiss.Index): The loaded Faiss index.
+            index_path (str): Path the index is saved to.
+            embeddings_path (str, optional): Path of the full-precision vectors (compressed mode only).
+        """
+        self.name = name
+        self.index = index
+        self.index_path = index_path
+        self.embeddings_path = embeddings_path
+        self.vectors = None
+
+    @property
+    def ntotal(self) -> int:
+        """
+        Returns the number of vectors of the version. In compressed mode, the full-precision
+        vectors are counted since the compressed index is empty until it is trained.
+        """
+        return self.index.ntotal if self.vectors is None else len(self.vectors)
+
+
 @singleton
 class FaissHelper:
     """
     A helper class for managing and querying a Faiss index with vector embeddings.
+
+    Two storage modes are available through the 'faiss_index_mode' config entry:
+    - 'flat': the full-precision vectors are kept in RAM in an exact index.
+    - 'sq8', 'fp16' or 'pq': a compressed index is kept in RAM to generate candidates,
+      which are then re-ranked exactly against full-precision vectors memory-mapped from disk.
+
+    The live index is held by an `IndexVersion` which can be swapped atomically with `swap`.
     """
 
+    COMPRESSED_MODES = ('sq8', 'fp16', 'pq')
+
     def __init__(self, embedding_dim: int):
         """
         Initializes the Faiss index for embedding similarity searches.
@@ -20,15 +59,222 @@ class FaissHelper:
             embedding_dim (int): The dimension of the embedding vectors.
         """
         self.embedding_dim = embedding_dim
-        self.index_path = config['faiss_index_path']
+        index_path = config['faiss_index_path']
         readonly_faiss_index_path = config['readonly_faiss_index_path']
 
-        if Path(self.index_path).exists():
-            self.index = faiss.read_index(self.index_path)
+        self.mode = config.get('faiss_index_mode', 'flat')
+        if self.mode != 'flat' and self.mode not in self.COMPRESSED_MODES:
+            raise ValueError(f"Unknown Faiss index mode: {self.mode}")
+        self.rerank_factor = config.get('rerank_factor', 10)
+        self.min_training_vectors = config.get('min_training_vectors', 1000)
+
+        # Searches and writes may come from different worker pools
+        self.lock = threading.RLock()
+
+        # Orders the index files written outside 'lock' (training, purge), so that the saved
+        # compressed index always holds a prefix of the full-precision vectors file
+        self.__persist_lock = threading.Lock()
+        self.__training = False
+
+        if Path(index_path).exists():
+            source_path = index_path
         elif Path(readonly_faiss_index_path).exists():
-            self.index = faiss.read_index(readonly_faiss_index_path)
+            source_path = readonly_faiss_index_path
+        else:
+            source_path = None
+
+        if self.is_compressed:
+            self.version = self.load(
+                "initial", source_path, config['compressed_faiss_index_path'], config['embeddings_path']
+            )
+        else:
+            self.version = self.load("initial", source_path, index_path)
+
+    @property
+    def is_compressed(self) -> bool:
+        """
+        Returns whether the index is compressed and needs an exact re-rank.
+
+        Returns:
+            bool: True if the index mode is not 'flat'.
+        """
+        return self.mode != 'flat'
+
+    @property
+    def index(self) -> faiss.Index:
+        """
+        Returns the Faiss index of the live version.
+        """
+        return self.version.index
+
+    def __create_compressed_index(self) -> faiss.Index:
+        """
+        Creates an empty (untrained) compressed index for the configured mode.
+
+        Returns:
+            faiss.Index: A scalar-quantized or product-quantized index.
+        """
+        if self.mode == 'sq8':
+            return faiss.IndexScalarQuantizer(self.embedding_dim, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_L2)
+        if self.mode == 'fp16':
+            return faiss.IndexScalarQuantizer(self.embedding_dim, faiss.ScalarQuantizer.QT_fp16, faiss.METRIC_L2)
+
+        return faiss.IndexPQ(self.embedding_dim, config.get('pq_subquantizers', 96), 8, faiss.METRIC_L2)
+
+    def load(self, name: str, source_path: str, index_path: str, embeddings_path: str = None) -> IndexVersion:
+        """
+        Loads an index version without touching the live one.
+
+        In flat mode, the flat index is read from 'source_path'. In compressed mode, the full-precision
+        vectors memory-mapped from 'embeddings_path' are the source of truth: they are only seeded from
+        the flat index when the file is missing, since the flat index never receives uploads. The compressed
+        index read from 'index_path' is caught up with the vectors appended since it was saved, or rebuilt
+        from them if it cannot be. It stays untrained and empty until 'min_training_vectors' vectors are stored.
+
+        Args:
+            name (str): Name of the version.
+            source_path (str): Path of the flat index, or None to start from an empty index.
+            index_path (str): Path the index of this version is saved to.
+            embeddings_path (str, optional): Path of the full-precision vectors (compressed mode only).
+
+        Returns:
+            IndexVersion: The loaded version.
+        """
+        if not self.is_compressed:
+            index = faiss.read_index(source_path) if source_path else faiss.IndexFlatL2(self.embedding_dim)
+            return IndexVersion(name, index, index_path)
+
+        version = IndexVersion(name, None, index_path, embeddings_path)
+
+        if Path(embeddings_path).exists():
+            self.__truncate_to_whole_vectors(embeddings_path)
+            self.__load_full_precision_vectors(version)
+        else:
+            if source_path is None:
+                embeddings = np.empty((0, self.embedding_dim), dtype=np.float32)
+            else:
+                flat_index = faiss.read_index(source_path)
+                embeddings = flat_index.reconstruct_n(0, flat_index.ntotal)
+                del flat_index
+
+            logger.info("Seeding full-precision vectors with %d vectors from the flat index", len(embeddings))
+            self.__write_full_precision_vectors(version, embeddings)
+
+        if Path(index_path).exists():
+            version.index = faiss.read_index(index_path)
+            saved_ntotal = version.index.ntotal
+            if self.__catch_up(version):
+                if version.index.ntotal != saved_ntotal:
+                    self.__write_index(index_path, faiss.serialize_index(version.index))
+                logger.info("Compressed Faiss index (%s) loaded with %d vectors", self.mode, version.index.ntotal)
+                return version
+            logger.warning("Compressed Faiss index and full-precision vectors are out of sync, rebuilding")
+
+        version.index = self.__create_compressed_index()
+        logger.info("Building compressed Faiss index (%s) from %d vectors", self.mode, len(version.vectors))
+        self.__catch_up(version)
+        self.__write_index(index_path, faiss.serialize_index(version.index))
+        return version
+
+    def __truncate_to_whole_vectors(self, embeddings_path: str) -> None:
+        """
+        Drops the partial vector an interrupted append may have left at the end of the vectors file.
+
+        Args:
+            embeddings_path (str): Path of the full-precision vectors.
+        """
+        size = Path(embeddings_path).stat().st_size
+        partial_size = size % (self.embedding_dim * 4)
+        if partial_size:
+            logger.warning("Dropping a partial vector of %d bytes at the end of %s", partial_size, embeddings_path)
+            os.truncate(embeddings_path, size - partial_size)
+
+    def __catch_up(self, version: IndexVersion) -> bool:
+        """
+        Adds to a compressed index the full-precision vectors it does not hold yet, training it first
+        if enough vectors are stored. The saved index holds a prefix of the vectors file, since the file
+        is only appended to between two saves, so the missing vectors are the last ones.
+
+        Args:
+            version (IndexVersion): The version whose index is caught up.
+
+        Returns:
+            bool: False if the index holds vectors the file does not, and must be rebuilt.
+        """
+        n_indexed, n_vectors = version.index.ntotal, len(version.vectors)
+        if not version.index.is_trained:
+            if n_indexed:
+                return False
+            self.__train_if_ready(version)
+            return True
+
+        if n_indexed > n_vectors:
+            return False
+        if n_indexed < n_vectors:
+            version.index.add(np.asarray(version.vectors[n_indexed:]))
+        return True
+
+    def __train_if_ready(self, version: IndexVersion) -> None:
+        """
+        Trains an untrained compressed index on all the full-precision vectors and fills it,
+        once at least 'min_training_vectors' of them are stored. Until then, searches are exact.
+
+        Args:
+            version (IndexVersion): The version whose index is trained.
+        """
+        if len(version.vectors) < self.min_training_vectors:
+            return
+
+        vectors = np.asarray(version.vectors)
+        logger.info("Training compressed Faiss index (%s) on %d vectors", self.mode, len(vectors))
+        version.index.train(vectors)
+        version.index.add(vectors)
+
+    def swap(self, version: IndexVersion) -> IndexVersion:
+        """
+        Replaces the live version atomically. Searches already holding the lock finish
+        on the previous version, the following ones run on the new version.
+
+        Args:
+            version (IndexVersion): The version to make live.
+
+        Returns:
+            IndexVersion: The previous live version.
+        """
+        with self.lock:
+            previous, self.version = self.version, version
+        logger.info(f"Faiss index swapped from version '{previous.name}' to '{version.name}'")
+        return previous
+
+    def __load_full_precision_vectors(self, version: IndexVersion) -> None:
+        """
+        Memory-maps the full-precision vectors file (read-only) used for the exact re-rank.
+
+        Args:
+            version (IndexVersion): The version whose vectors are mapped.
+        """
+        path = Path(version.embeddings_path)
+        n_vectors = path.stat().st_size // (self.embedding_dim * 4) if path.exists() else 0
+
+        if n_vectors:
+            version.vectors = np.memmap(path, dtype=np.float32, mode='r', shape=(n_vectors, self.embedding_dim))
         else:
-            self.index = faiss.IndexFlatL2(self.embedding_dim)
+            version.vectors = np.empty((0, self.embedding_dim), dtype=np.float32)
+
+    def __write_full_precision_vectors(self, version: IndexVersion, embeddings: np.array) -> None:
+        """
+        Replaces the full-precision vectors file atomically and maps it again.
+
+        Args:
+            version (IndexVersion): The version whose vectors are written.
+            embeddings (np.array): All the full-precision vectors, in index order.
+        """
+        # Drop the current mapping before replacing the underlying file
+        version.vectors = None
+        tmp_path = f"{version.embeddings_path}.tmp"
+        np.ascontiguousarray(embeddings, dtype=np.float32).tofile(tmp_path)
+        os.replace(tmp_path, version.embeddings_path)
+        self.__load_full_precision_vectors(version)
 
     def __check_embeddings(self, embeddings: np.array) -> np.array:
         """
@@ -56,16 +302,102 @@ class FaissHelper:
     def add(self, embeddings: np.array) -> None:
         """
         Adds embeddings to the Faiss index after validating dimensions.
+        In compressed mode, the full-precision vectors are also appended to the memory-mapped file,
+        which is enough to persist them: the saved index is caught up on next load. An untrained
+        index is trained in the background once enough vectors are stored.
 
         Args:
             embeddings (np.array): Embedding vectors to be added to the index.
         """
         embeddings = self.__check_embeddings(embeddings)
-        self.index.add(embeddings)
+        with self.lock:
+            version = self.version
+            if not self.is_compressed:
+                version.index.add(embeddings)
+                return
+
+            trained = version.index.is_trained
+            if trained:
+                version.index.add(embeddings)
+
+            # Only stored once the index accepted them, so that both stay aligned
+            with open(version.embeddings_path, 'ab') as f:
+                embeddings.tofile(f)
+            self.__load_full_precision_vectors(version)
+
+            if not trained and not self.__training and len(version.vectors) >= self.min_training_vectors:
+                self.__training = True
+                threading.Thread(target=self.__train_in_background, args=(version,), daemon=True).start()
+
+    def __train_in_background(self, version: IndexVersion) -> None:
+        """
+        Trains a new compressed index on the stored vectors without holding the lock, so that searches
+        keep running exactly meanwhile, then catches it up with the vectors added since and installs it.
+
+        Args:
+            version (IndexVersion): The version whose index is trained.
+        """
+        # Training is background work, it must not take every core from the searches
+        faiss.omp_set_num_threads(1)
+        try:
+            with self.__persist_lock:
+                with self.lock:
+                    if version.index.is_trained:
+                        return
+                    # The file is only appended to until the index is installed, so this mapping stays valid
+                    vectors = version.vectors
+
+                index = self.__create_compressed_index()
+                logger.info("Training compressed Faiss index (%s) on %d vectors", self.mode, len(vectors))
+                index.train(np.asarray(vectors))
+                index.add(np.asarray(vectors))
+
+                with self.lock:
+                    index.add(np.asarray(version.vectors[len(vectors):]))
+                    version.index = index
+                    data = faiss.serialize_index(index)
+                self.__write_index(version.index_path, data)
+        finally:
+            with self.lock:
+                self.__training = False
+
+    def __write_index(self, index_path: str, data: np.array) -> None:
+        """
+        Writes a serialized index atomically, so that a crash never leaves a partial file.
+        Indexes are serialized under the lock and written after releasing it.
+
+        Args:
+            index_path (str): Path the index is saved to.
+            data (np.array): The index serialized by 'faiss.serialize_index'.
+        """
+        tmp_path = f"{index_path}.tmp"
+        data.tofile(tmp_path)
+        os.replace(tmp_path, index_path)
+
+    def __rerank(self, vectors: np.array, query_embedding: np.array, candidates: np.array, k: int) -> (np.array, np.array):
+        """
+        Re-ranks candidate vectors exactly against their full-precision values.
+
+        Args:
+            vectors (np.array): The memory-mapped full-precision vectors.
+            query_embedding (np.array): The query embedding, as a 2D array with a single row.
+            candidates (np.array): Indices of the candidates returned by the compressed index.
+            k (int): Number of closest neighbors to keep.
+
+        Returns:
+            tuple: Exact squared L2 distances and indices of the k closest candidates.
+        """
+        # Sorted reads keep the accesses to the memory-mapped file sequential
+        candidates = np.sort(candidates[candidates >= 0])
+        distances = ((vectors[candidates] - query_embedding) ** 2).sum(axis=1)
+
+        top_k = np.argsort(distances)[:k]
+        return distances[top_k], candidates[top_k]
 
     def search(self, query_embedding: np.array, k: int = 5) -> (np.array, np.array):
         """
         Searches the index for the k most similar embeddings to the query embedding.
+        In compressed mode, 'rerank_factor * k' candidates are re-ranked exactly.
 
         Args:
             query_embedding (np.array): The query embedding to search against the index.
@@ -77,9 +409,21 @@ class FaissHelper:
                 - indices (np.array): Array of indices for the closest neighbors.
         """
         query_embedding = self.__check_embeddings(query_embedding)
-        distances, indices = self.index.search(query_embedding, k)
+        with self.lock:
+            version = self.version
+            if not self.is_compressed:
+                distances, indices = version.index.search(query_embedding, k)
+                return distances.reshape(-1), indices.reshape(-1)
+
+            # Until the index is trained, all the stored vectors are searched exactly
+            if not version.index.is_trained:
+                return self.__rerank(version.vectors, query_embedding, np.arange(len(version.vectors)), k)
 
-        return distances.reshape(-1), indices.reshape(-1)
+            if version.index.ntotal == 0:
+                return np.empty(0, dtype=np.float32), np.empty(0, dtype=np.int64)
+
+            _, candidates = version.index.search(query_embedding, k * self.rerank_factor)
+            return self.__rerank(version.vectors, query_embedding, candidates.reshape(-1), k)
 
     def get_last_index(self) -> int:
         """
@@ -88,13 +432,15 @@ class FaissHelper:
         Returns:
             int: Total number of embeddings in the index.
         """
-        return self.index.ntotal
+        with self.lock:
+            return self.version.ntotal
 
     def save(self) -> None:
         """
         Saves the current state of the Faiss index to a file.
         """
-        faiss.write_index(self.index, self.index_path)
+        with self.lock:
+            faiss.write_index(self.version.index, self.version.index_path)
         logger.info("Faiss index saved")
 
     def purge_user_data(self, indexes: list) -> None:
@@ -104,6 +450,22 @@ class FaissHelper:
         Args:
             indexes (list): List of indices for embeddings to be removed.
         """
-        if indexes:
-            embedding_indexes_array = np.array(indexes, dtype=np.int64)
-            self.index.remove_ids(faiss.IDSelectorArray(embedding_indexes_array))
+        if not indexes:
+            return
+
+        embedding_indexes_array = np.array(indexes, dtype=np.int64)
+        with self.__persist_lock:
+            with self.lock:
+                version = self.version
+                version.index.remove_ids(faiss.IDSelectorArray(embedding_indexes_array))
+                if not self.is_compressed:
+                    return
+
+                # The saved index is dropped before the vectors file is compacted,
+                # so that a crash in between can never leave it ahead of the file
+                Path(version.index_path).unlink(missing_ok=True)
+                self.__write_full_precision_vectors(
+                    version, np.delete(np.asarray(version.vectors), embedding_indexes_array, axis=0)
+                )
+                data = faiss.serialize_index(version.index)
+            self.__write_index(version.index_path, data)
@@ -0,0 +1,169 @@
+import threading
+from pathlib import Path
+from typing import List
+from backend import config, logger
+from backend.orm import ORM
+from backend.utils.faiss_helper import FaissHelper, IndexVersion
+from backend.utils.misc import singleton
+
+
+@singleton
+class IndexRegistry:
+    """
+    A registry of Faiss index versions that can be swapped into the live FaissHelper without restart.
+
+    Each version is a directory of 'faiss_versions_path' holding a flat 'index.faiss', built offline.
+    In compressed mode, the compressed index and full-precision vectors are generated next to it on first load.
+    The name of the live version is persisted in a 'LIVE' file so that it is restored on restart.
+    """
+
+    def __init__(self, faiss_helper: FaissHelper, orm: ORM):
+        """
+        Args:
+            faiss_helper (FaissHelper): The helper holding the live index.
+            orm (ORM): ORM instance used to validate versions against the database.
+        """
+        self.faiss_helper = faiss_helper
+        self.orm = orm
+        self.versions_path = Path(config['faiss_versions_path'])
+        self.previous = None
+
+        # Only one swap or rollback may run at a time
+        self.__swap_lock = threading.Lock()
+
+        live_file = self.versions_path / "LIVE"
+        if live_file.exists():
+            try:
+                self.swap(live_file.read_text().strip())
+                self.previous = None
+            except (FileNotFoundError, ValueError) as e:
+                logger.warning(f"Could not restore the live index version: {e}")
+
+    def list_versions(self) -> List[str]:
+        """
+        Lists the versions available on disk.
+
+        Returns:
+            List[str]: Names of the versions, sorted.
+        """
+        if not self.versions_path.exists():
+            return []
+
+        return sorted(path.parent.name for path in self.versions_path.glob("*/index.faiss"))
+
+    def status(self) -> dict:
+        """
+        Returns the live and previous versions along with the versions available on disk.
+
+        Returns:
+            dict: The registry status.
+        """
+        return {
+            "live": self.faiss_helper.version.name,
+            "previous": self.previous.name if self.previous else None,
+            "versions": self.list_versions()
+        }
+
+    def __load_version(self, name: str) -> IndexVersion:
+        """
+        Loads a version from disk next to the live one.
+
+        Args:
+            name (str): Name of the version.
+
+        Raises:
+            FileNotFoundError: If the version does not exist.
+
+        Returns:
+            IndexVersion: The loaded version.
+        """
+        # Only names listed on disk are joined to the path, so that a name cannot escape the registry
+        if name not in self.list_versions():
+            raise FileNotFoundError(f"Index version '{name}' not found in {self.versions_path}")
+
+        version_path = self.versions_path / name
+        source_path = version_path / "index.faiss"
+
+        if self.faiss_helper.is_compressed:
+            return self.faiss_helper.load(
+                name, str(source_path), str(version_path / "compressed_index.faiss"), str(version_path / "embeddings.f32")
+            )
+        return self.faiss_helper.load(name, str(source_path), str(source_path))
+
+    def __validate(self, version: IndexVersion) -> None:
+        """
+        Checks that a version matches the live embedding dimension and the database.
+        Embedding indexes are positions in the index, so the index must hold exactly
+        'max(embedding_index) + 1' vectors.
+
+        Args:
+            version (IndexVersion): The version to validate.
+
+        Raises:
+            ValueError: If the version does not match.
+        """
+        if version.index.d != self.faiss_helper.embedding_dim:
+            raise ValueError(f"Index version '{version.name}' has dimension {version.index.d}, "
+                             f"expected {self.faiss_helper.embedding_dim}")
+
+        _, max_index, _ = self.orm.get_embedding_index_range()
+        expected = 0 if max_index is None else max_index + 1
+        if version.ntotal != expected:
+            raise ValueError(f"Index version '{version.name}' holds {version.ntotal} vectors, "
+                             f"the database references {expected}")
+
+    def __swap_to(self, version: IndexVersion) -> None:
+        """
+        Validates a version and makes it live, keeping the current one for rollback.
+        Holding the index lock ensures no embedding is added between the validation and the swap.
+
+        Args:
+            version (IndexVersion): The version to make live.
+        """
+        with self.faiss_helper.lock:
+            self.__validate(version)
+            self.previous = self.faiss_helper.swap(version)
+
+        # The initial version is not part of the registry, it is loaded by default
+        live_file = self.versions_path / "LIVE"
+        if (self.versions_path / version.name / "index.faiss").exists():
+            live_file.write_text(version.name)
+        else:
+            live_file.unlink(missing_ok=True)
+
+    def swap(self, name: str) -> dict:
+        """
+        Loads a version, validates it and swaps it in atomically.
+
+        Args:
+            name (str): Name of the version.
+
+        Raises:
+            FileNotFoundError: If the version does not exist.
+            ValueError: If the version does not match the database.
+
+        Returns:
+            dict: The registry status after the swap.
+        """
+        with self.__swap_lock:
+            logger.info(f"Loading index version '{name}'")
+            self.__swap_to(self.__load_version(name))
+            return self.status()
+
+    def rollback(self) -> dict:
+        """
+        Swaps the previous version back in.
+
+        Raises:
+            ValueError: If there is no previous version or it does not match the database anymore.
+
+        Returns:
+            dict: The registry status after the rollback.
+        """
+        with self.__swap_lock:
+            if self.previous is None:
+                raise ValueError("No previous index version to roll back to")
+
+            logger.info(f"Rolling back to index version '{self.previous.name}'")
+            self.__swap_to(self.previous)
+            return self.status()
@@ -0,0 +1,217 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+import faiss
+import torch
+from backend import config, logger
+from backend.utils.misc import singleton
+
+
+class SchedulerOverloaded(Exception):
+    """
+    Raised when a work class queue is full and a new task must be rejected.
+    """
+
+    def __init__(self, work_class: str, status_code: int, retry_after: int):
+        super().__init__(f"Work class '{work_class}' is overloaded, retry in {retry_after}s")
+        self.work_class = work_class
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class WorkClass:
+    """
+    A bounded pool dedicated to one kind of work (query encode, image encode, vector search).
+    """
+
+    def __init__(self, name: str, settings: dict):
+        """
+        Creates the executor of the work class and its admission bookkeeping.
+
+        Args:
+            name (str): Name of the work class.
+            settings (dict): Settings of the work class taken from the config file.
+        """
+        self.name = name
+        self.workers = settings.get('workers', 1)
+        self.queue_size = settings.get('queue_size', 0)
+        self.threads = settings.get('threads', 1)
+        self.interactive = settings.get('interactive', True)
+        self.reject_status = settings.get('reject_status', 503)
+        self.retry_after = settings.get('retry_after', 1)
+
+        # Tasks admitted (running + waiting) in this work class
+        self.pending = 0
+
+        self.executor = ThreadPoolExecutor(
+            max_workers=self.workers,
+            thread_name_prefix=f"{name}-worker",
+            initializer=self.__init_worker_thread
+        )
+
+    def __init_worker_thread(self):
+        """
+        Limits the number of threads torch and FAISS may use from a worker of this class.
+        Both libraries rely on OpenMP whose thread count is set per calling thread.
+        """
+        torch.set_num_threads(self.threads)
+        faiss.omp_set_num_threads(self.threads)
+
+    @property
+    def capacity(self) -> int:
+        """
+        Returns the maximum number of tasks this class can hold before rejecting new ones.
+
+        Returns:
+            int: Number of workers plus the queue size.
+        """
+        return self.workers + self.queue_size
+
+
+@singleton
+class ResourceScheduler:
+    """
+    Dispatches CPU-bound work to separate bounded pools so that uploads cannot starve searches.
+    Interactive work classes take priority: non-interactive tasks wait for them to drain before starting.
+    """
+
+    def __init__(self):
+        """
+        Builds one work class per entry of the 'scheduler' section of the config file.
+        """
+        settings = config.get('scheduler', {})
+        self.max_yield_time = settings.get('max_yield_time', 5)
+        self.work_classes = {
+            name: WorkClass(name, work_class_settings)
+            for name, work_class_settings in settings.get('work_classes', {}).items()
+        }
+
+        self.__lock = threading.Lock()
+        self.__interactive_done = threading.Condition(self.__lock)
+        self.__interactive_pending = 0
+
+        logger.info("Resource scheduler initialized with work classes: %s", list(self.work_classes))
+
+    def __admit(self, work_class: WorkClass) -> None:
+        """
+        Reserves a slot in the work class or rejects the task if the class is full.
+
+        Args:
+            work_class (WorkClass): The work class the task belongs to.
+
+        Raises:
+            SchedulerOverloaded: If the work class has no slot left.
+        """
+        with self.__lock:
+            if work_class.pending >= work_class.capacity:
+                logger.warning("Rejecting task for work class '%s': %d tasks pending",
+                               work_class.name, work_class.pending)
+                raise SchedulerOverloaded(work_class.name, work_class.reject_status, work_class.retry_after)
+
+            work_class.pending += 1
+            if work_class.interactive:
+                self.__interactive_pending += 1
+
+    def __release(self, work_class: WorkClass) -> None:
+        """
+        Frees the slot taken by a task and wakes up the tasks yielding to interactive work.
+
+        Args:
+            work_class (WorkClass): The work class the task belongs to.
+        """
+        with self.__lock:
+            work_class.pending -= 1
+            if work_class.interactive:
+                self.__interactive_pending -= 1
+                if self.__interactive_pending == 0:
+                    self.__interactive_done.notify_all()
+
+    def __yield_to_interactive(self) -> None:
+        """
+        Blocks until no interactive task is pending, for at most 'max_yield_time' seconds
+        so that background work cannot be starved forever.
+        """
+        deadline = time.monotonic() + self.max_yield_time
+        with self.__lock:
+            while self.__interactive_pending > 0:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.__interactive_done.wait(remaining)
+
+    def __execute(self, work_class: WorkClass, fn: Callable, *args, **kwargs) -> Any:
+        """
+        Runs a task inside a worker thread of its work class.
+        """
+        try:
+            if not work_class.interactive:
+                self.__yield_to_interactive()
+            return fn(*args, **kwargs)
+        finally:
+            self.__release(work_class)
+
+    async def run(self, work_class_name: str, fn: Callable, *args, **kwargs) -> Any:
+        """
+        Runs a blocking function in the pool of the given work class without blocking the event loop.
+
+        Args:
+            work_class_name (str): Name of the work class, as declared in the config file.
+            fn (Callable): The blocking function to run.
+            *args: Positional arguments passed to the function.
+            **kwargs: Keyword arguments passed to the function.
+
+        Returns:
+            Any: The value returned by the function.
+
+        Raises:
+            SchedulerOverloaded: If the work class queue is full.
+        """
+        work_class = self.work_classes[work_class_name]
+        self.__admit(work_class)
+
+        loop = asyncio.get_running_loop()
+        try:
+            future = loop.run_in_executor(
+                work_class.executor, lambda: self.__execute(work_class, fn, *args, **kwargs)
+            )
+        except BaseException:
+            self.__release(work_class)
+            raise
+
+        return await future
+
+    def run_on_workers(self, work_class_name: str, fn: Callable, *args, **kwargs) -> list:
+        """
+        Runs a blocking function once on every worker thread of a work class and waits for all of them.
+        Used at startup to warm up the per-thread state (OpenMP pools, thread limits) of each worker.
+
+        Args:
+            work_class_name (str): Name of the work class, as declared in the config file.
+            fn (Callable): The blocking function to run.
+            *args: Positional arguments passed to the function.
+            **kwargs: Keyword arguments passed to the function.
+
+        Returns:
+            list: The value returned by the function on each worker.
+        """
+        work_class = self.work_classes[work_class_name]
+
+        # Each task holds its worker until all of them have started, so that no worker runs two of them
+        barrier = threading.Barrier(work_class.workers)
+
+        def run_on_worker():
+            barrier.wait()
+            return fn(*args, **kwargs)
+
+        futures = [work_class.executor.submit(run_on_worker) for _ in range(work_class.workers)]
+        return [future.result() for future in futures]
+
+    def shutdown(self) -> None:
+        """
+        Stops all the worker pools, waiting for running tasks to complete.
+        """
+        for work_class in self.work_classes.values():
+            work_class.executor.shutdown(wait=True)
@@ -1,4 +1,5 @@
 import os
+import time
 import torch
 from PIL import Image
 from transformers import AutoProcessor, AutoModelForZeroShotImageClassification
@@ -24,8 +25,50 @@ class Vectorizer:
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
         self.processor = AutoProcessor.from_pretrained("zer0int/CLIP-GmP-ViT-L-14")
         self.model = AutoModelForZeroShotImageClassification.from_pretrained(config["clip_model"]).to(self.device)
+        self.model.eval()
         logger.info("CLIP processor and model initialized on device: %s", self.device)
 
+        # Feature paths, replaced by their compiled or traced version if an optimization is set
+        self.text_features = self.model.get_text_features
+        self.image_features = self.model.get_image_features
+        self.text_padding = True
+        self.__optimize_feature_paths(config.get("clip_optimization", "none"))
+
+    def __optimize_feature_paths(self, optimization: str) -> None:
+        """
+        Compiles or traces the text and image feature paths of the model.
+
+        Args:
+            optimization (str): 'none', 'torch_compile' or 'torchscript'.
+
+        Raises:
+            ValueError: If the optimization is unknown.
+        """
+        if optimization == "none":
+            return
+
+        if optimization == "torch_compile":
+            self.text_features = torch.compile(self.model.get_text_features, dynamic=True)
+            self.image_features = torch.compile(self.model.get_image_features, dynamic=True)
+        elif optimization == "torchscript":
+            # Traced graphs have fixed shapes: texts are always padded to the model max length
+            self.text_padding = "max_length"
+            text_inputs = self.processor(text=["a photo of a dog"], padding=self.text_padding, return_tensors="pt")
+            image_inputs = self.processor(images=[np.zeros((224, 224, 3), dtype=np.uint8)], return_tensors="pt")
+            with torch.inference_mode():
+                self.text_features = torch.jit.trace(
+                    self.model.get_text_features,
+                    (text_inputs["input_ids"].to(self.device), text_inputs["attention_mask"].to(self.device)),
+                    strict=False
+                )
+                self.image_features = torch.jit.trace(
+                    self.model.get_image_features, image_inputs["pixel_values"].to(self.device), strict=False
+                )
+        else:
+            raise ValueError(f"Unknown CLIP optimization: {optimization}")
+
+        logger.info("CLIP feature paths optimized with %s", optimization)
+
     @property
     def embedding_dim(self) -> int:
         """
@@ -53,8 +96,8 @@ class Vectorizer:
         for i in range(0, len(images), batch_size):
             batch_images = images[i:i + batch_size]
             inputs = self.processor(images=batch_images, return_tensors="pt").to(self.device)
-            with torch.no_grad():
-                image_embedding = self.model.get_image_features(**inputs)
+            with torch.inference_mode():
+                image_embedding = self.image_features(inputs["pixel_values"])
                 image_embedding /= image_embedding.norm(dim=-1, keepdim=True)
 
             for i in range(image_embedding.size(0)):
@@ -65,24 +108,60 @@ class Vectorizer:
 
         return image_embeddings_list
 
-    def compute_text_embedding(self, text: str) -> np.array:
+    def compute_text_embedding(self, text: str | List[str]) -> np.array:
         """
         Computes an embedding for a given text input.
 
         Args:
-            text (str): Text to be converted into an embedding.
+            text (str | List[str]): Text (or batch of texts) to be converted into an embedding.
 
         Returns:
             np.array: Computed text embedding.
         """
         logger.info("Encoding query text: %s", text)
-        inputs = self.processor(text=text, return_tensors="pt").to(self.device)
-        with torch.no_grad():
-            text_embedding = self.model.get_text_features(**inputs)
+        inputs = self.processor(text=text, padding=self.text_padding, return_tensors="pt").to(self.device)
+        with torch.inference_mode():
+            text_embedding = self.text_features(inputs["input_ids"], inputs["attention_mask"])
             text_embedding /= text_embedding.norm(dim=-1, keepdim=True)
 
         return text_embedding
 
+    def warm_up_text(self, batch_sizes: List[int], iterations: int) -> dict:
+        """
+        Runs representative text batches through the model so that kernels, tokenizer
+        and allocator are initialized before the first real query.
+
+        Args:
+            batch_sizes (List[int]): Batch sizes expected at query time.
+            iterations (int): Number of warm runs timed after the first (cold) one.
+
+        Returns:
+            dict: Cold and warm latencies in milliseconds for each batch size.
+        """
+        return {
+            batch_size: _time_runs(self.compute_text_embedding, iterations, ["a photo of a dog"] * batch_size)
+            for batch_size in batch_sizes
+        }
+
+    def warm_up_image(self, batch_sizes: List[int], iterations: int) -> dict:
+        """
+        Runs representative image batches through the model, see `warm_up_text`.
+
+        Args:
+            batch_sizes (List[int]): Batch sizes expected at upload time.
+            iterations (int): Number of warm runs timed after the first (cold) one.
+
+        Returns:
+            dict: Cold and warm latencies in milliseconds for each batch size.
+        """
+        return {
+            batch_size: _time_runs(
+                self.compute_image_embeddings, iterations,
+                np.zeros((batch_size, 224, 224, 3), dtype=np.uint8), batch_size=batch_size
+            )
+            for batch_size in batch_sizes
+        }
+
     def generate_and_store_image_embeddings(self, faiss_helper: FaissHelper, image_folder_path: str) -> List[str]:
         """
         Generates embeddings for images in a specified folder and stores them in a FAISS index.
@@ -110,7 +189,8 @@ class Vectorizer:
         
         return image_paths
 
-    def generate_and_store_embedding_from_user_image(self, images: List[dict], faiss_helper: FaissHelper, orm: ORM) -> None:
+    def generate_and_store_embedding_from_user_image(
+            self, images: List[dict], faiss_helper: FaissHelper, orm: ORM) -> (List[int], np.array):
         """
         Generates and stores embeddings for user-uploaded images in a FAISS index.
 
@@ -118,22 +198,56 @@ class Vectorizer:
             images (List[dict]): List of image data dictionaries containing the 'data' and 'filename' keys.
             faiss_helper (FaissHelper): FAISS helper instance for adding embeddings.
             orm (ORM): ORM instance for storing image metadata.
+
+        Raises:
+            Exception: If the images could not be stored in the database, in which case none is added to the index.
+
+        Returns:
+            tuple: The embedding indexes of the images and their embeddings, one row per image.
         """
         batch = []
-        last_faiss_index = faiss_helper.get_last_index()
-        for i, image in enumerate(images):
+        encoded_images = []
+        for image in images:
             resized_image = np.array(image["data"].resize((224, 224)))
+            encoded_images.append((image["filename"], image_to_based64(resized_image)))
 
             # the model doesn't handle alpha channel
             rgb_image = resized_image[:, :, :3]
             batch.append(rgb_image)
-            orm.add_image(image["filename"], image_to_based64(resized_image), last_faiss_index + i, 'user')
 
         kwargs = {"batch_size": len(batch)}
         embeddings = self.compute_image_embeddings(np.array(batch), **kwargs)
-        faiss_helper.add(embeddings)
+
+        # Reserving the indexes, storing the rows and adding the embeddings is one critical section,
+        # so that concurrent uploads or an index swap cannot interleave and misalign the database.
+        # The rows are committed in one transaction which raises on failure, before the index is touched.
+        with faiss_helper.lock:
+            last_faiss_index = faiss_helper.get_last_index()
+            orm.add_images_bulk([
+                (filename, base64_image, last_faiss_index + i, 'user')
+                for i, (filename, base64_image) in enumerate(encoded_images)
+            ])
+            faiss_helper.add(embeddings)
         logger.info("All uploaded images have been added to the database and FAISS index.")
 
+        return list(range(last_faiss_index, last_faiss_index + len(batch))), np.atleast_2d(np.array(embeddings))
+
+
+def _time_runs(fn, iterations: int, *args, **kwargs) -> dict:
+    """
+    Times a first (cold) call of a function followed by several warm calls.
+
+    Returns:
+        dict: The cold latency and the best warm latency, in milliseconds.
+    """
+    timings = []
+    for _ in range(iterations + 1):
+        start = time.perf_counter()
+        fn(*args, **kwargs)
+        timings.append((time.perf_counter() - start) * 1000)
+
+    return {"cold_ms": round(timings[0], 2), "warm_ms": round(min(timings[1:], default=timings[0]), 2)}
+
 
 def load_image_paths(image_directory: str) -> List[str]:
     """